@@ -4,16 +4,29 @@ Uses Claude Sonnet 4.5 for story elements and world building
 Uses Gemini 2.5 Pro for rules, dice rolling, and mechanics
 """
 
-import anthropic
-import google.generativeai as genai
-from google.cloud import texttospeech
 import streamlit as st
+import orjson
+import numpy as np
 import random
-import json
 import os
-import base64
+import re
+import glob
+import importlib.util
+import hashlib
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import Future, ThreadPoolExecutor
 from datetime import datetime
-from typing import List, Dict, Optional
+from typing import TYPE_CHECKING, Callable, List, Dict, Iterator, Optional
+from streamlit.delta_generator import DeltaGenerator
+
+if TYPE_CHECKING:
+    # Annotation-only; at runtime the SDKs are imported lazily by the getters that build their clients
+    import anthropic
+    import google.generativeai as genai
+    from google.api_core import retry as google_retry
+    from google.cloud import texttospeech
 
 # Initialize clients for Sonnet and Gemini
 # Try to get API keys from Streamlit secrets first, then environment variables
@@ -29,7 +42,7 @@ try:
         with tempfile.NamedTemporaryFile(mode='w', delete=False, suffix='.json') as f:
             json_lib.dump(dict(st.secrets["GOOGLE_APPLICATION_CREDENTIALS_JSON"]), f)
             os.environ["GOOGLE_APPLICATION_CREDENTIALS"] = f.name
-except:
+except (FileNotFoundError, KeyError):
     # Fallback to environment variables for local development
     ANTHROPIC_API_KEY = os.getenv("ANTHROPIC_API_KEY")
     GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
@@ -38,48 +51,124 @@ if not ANTHROPIC_API_KEY or not GEMINI_API_KEY:
     st.error("⚠️ API keys not configured! Please add ANTHROPIC_API_KEY and GEMINI_API_KEY to your Streamlit secrets or environment variables.")
     st.stop()
 
-sonnet_client = anthropic.Anthropic(api_key=ANTHROPIC_API_KEY)
-genai.configure(api_key=GEMINI_API_KEY)
-gemini_client = genai.GenerativeModel('gemini-2.0-flash-exp')
-
-# Initialize Google Cloud Text-to-Speech client
-# Note: This uses GOOGLE_APPLICATION_CREDENTIALS env var or default credentials
+# Clients are built once per process and reused across reruns and sessions.
+# The SDKs are imported on first use so sessions that never call a model (e.g. just loading a save)
+# don't pay for importing them.
+@st.cache_resource(show_spinner=False)
+def get_sonnet_client(api_key: str) -> "anthropic.Anthropic":
+    import anthropic
+    return anthropic.Anthropic(api_key=api_key)
+
+@st.cache_resource(show_spinner=False)
+def get_gemini_client(api_key: str) -> "genai.GenerativeModel":
+    import google.generativeai as genai
+    genai.configure(api_key=api_key)
+    return genai.GenerativeModel('gemini-2.0-flash-exp')
+
+@st.cache_resource(show_spinner=False)
+def get_tts_client() -> "texttospeech.TextToSpeechClient":
+    # google.cloud.texttospeech pulls in gRPC and protobuf, the heaviest import in the app
+    from google.cloud import texttospeech
+    # Note: This uses GOOGLE_APPLICATION_CREDENTIALS env var or default credentials
+    try:
+        return texttospeech.TextToSpeechClient()
+    except Exception as e:
+        raise RuntimeError(f"Google Cloud TTS not configured. Error: {str(e)}") from e
+
+SONNET_MODEL = "claude-sonnet-4-20250514"
+# Shared static prefix for every Sonnet request, marked for Anthropic prompt caching
+SONNET_SYSTEM_PROMPT = """You are the game master and narrator for Voidwalkers, a dark fantasy TTRPG \
+set in a world threatened by mysterious void creatures.
+
+Style guide:
+- Write vivid, atmospheric, immersive prose with a brooding, mysterious tone
+- Favor moral complexity over clear-cut good and evil
+- Use second person when describing what happens to the player
+- Open with a short title line when asked to create a named location, NPC, or quest"""
+# Recent narration exchanges replayed to Sonnet as conversation; bounded so request size stays capped
+# (the oldest half is dropped at once when full, keeping the cached prefix stable between evictions)
+SONNET_HISTORY_TURNS = 10
+GEMINI_REQUESTS_PER_MINUTE = 20
+REPLY_CACHE_TTL_SECONDS = 3600
+
+# Cheap probe for gating TTS UI; the client itself is only built when audio is first needed
 try:
-    tts_client = texttospeech.TextToSpeechClient()
-except Exception as e:
-    st.warning(f"⚠️ Google Cloud TTS not configured. TTS features will be unavailable. Error: {str(e)}")
-    tts_client = None
+    TTS_AVAILABLE = importlib.util.find_spec("google.cloud.texttospeech") is not None
+except ModuleNotFoundError:
+    # find_spec raises rather than returning None when the google.cloud namespace itself is missing
+    TTS_AVAILABLE = False
+
+# Saves live in their own directory, indexed by a manifest so listing them doesn't parse every file.
+# The manifest is a dotfile so the "*.json" save glob never picks it up and no save name can collide with it.
+SAVES_DIR = "saves"
+SAVES_MANIFEST_NAME = ".manifest.json"
+SAVES_MANIFEST = os.path.join(SAVES_DIR, SAVES_MANIFEST_NAME)
+AUTOSAVE_FILE = os.path.join(SAVES_DIR, "game_state.json")
+
+def migrate_legacy_saves():
+    """Move saves that older versions wrote to the working directory into SAVES_DIR"""
+    for legacy_file in glob.glob("*.json"):
+        try:
+            with open(legacy_file, "rb") as f:
+                data = orjson.loads(f.read())
+        except (OSError, orjson.JSONDecodeError):
+            continue
+        if isinstance(data, dict) and data.get("character"):
+            os.replace(legacy_file, os.path.join(SAVES_DIR, legacy_file))
+
+if not os.path.exists(SAVES_DIR):
+    os.makedirs(SAVES_DIR)
+    migrate_legacy_saves()
+
+# Story and combat logs are ring buffers holding exactly what their panes show, so appends trim in O(1)
+# and save size stays bounded however long the campaign runs
+LOG_MAX_ENTRIES = {"story_log": 20, "combat_log": 10}
+
+def bound_logs(state: Dict) -> Dict:
+    """Convert the story/combat logs of a game state into bounded deques"""
+    for log_key, max_entries in LOG_MAX_ENTRIES.items():
+        state[log_key] = deque(state.get(log_key, []), maxlen=max_entries)
+    return state
+
+def split_quests(state: Dict) -> Dict:
+    """Sort a game state's quests into active_quests / completed_quests (older saves keep one "quests" list)"""
+    active_quests = state.setdefault("active_quests", [])
+    completed_quests = state.setdefault("completed_quests", [])
+    for quest in state.pop("quests", []):
+        (active_quests if quest.get("status") == "active" else completed_quests).append(quest)
+    return state
 
 # Initialize session state
 def get_default_game_state():
-    return {
+    return bound_logs({
         "character": None,
         "current_location": None,
         "inventory": [],
         "npcs": [],
         "locations": [],
-        "quests": [],
+        "active_quests": [],
+        "completed_quests": [],
         "combat_log": [],
         "story_log": [],
         "game_started": False,
         "current_encounter": None,
         "world_context": "",
         "tts_enabled": False
-    }
+    })
 
 if 'game_state' not in st.session_state:
-    if os.path.exists("game_state.json"):
+    if os.path.exists(AUTOSAVE_FILE):
         try:
-            with open("game_state.json", "r") as f:
-                loaded_state = json.load(f)
+            with open(AUTOSAVE_FILE, "rb") as f:
+                loaded_state = orjson.loads(f.read())
                 # Validate that it has the required keys
                 default_state = get_default_game_state()
                 if "character" in loaded_state and "current_location" in loaded_state:
-                    st.session_state.game_state = loaded_state
+                    st.session_state.game_state = bound_logs(split_quests(loaded_state))
                 else:
                     # Old format, use default
                     st.session_state.game_state = default_state
-        except:
+        except (OSError, orjson.JSONDecodeError):
             st.session_state.game_state = get_default_game_state()
     else:
         st.session_state.game_state = get_default_game_state()
@@ -88,109 +177,404 @@ def get_game_state():
     """Helper function to safely get game state"""
     return st.session_state.game_state
 
-def save_game_state(filename: str = "game_state.json"):
-    """Save game state to a specific file"""
-    with open(filename, "w") as f:
-        json.dump(st.session_state.game_state, f, indent=2)
+def write_atomic(filename: str, payload: bytes):
+    """Write via a temp file + rename, so a crash mid-write never leaves a truncated file"""
+    # Sessions are threads in one process and share the autosave and manifest, so each writer gets its own temp file
+    tmp_filename = f"{filename}.{threading.get_ident()}.tmp"
+    with open(tmp_filename, "wb", buffering=1 << 16) as f:
+        f.write(payload)
+    os.replace(tmp_filename, filename)
+
+def save_summary(state: Dict) -> Dict:
+    """Manifest entry describing a save, enough to list it without opening the file"""
+    char = state["character"]
+    return {
+        "name": char.get("name", "Unknown"),
+        "class": char.get("class", "Unknown"),
+        "level": char.get("level", 1),
+        "hp": char.get("hp", 0),
+        "max_hp": char.get("max_hp", 0),
+        "location": state.get("current_location") or "Unknown"
+    }
+
+def read_saves_manifest() -> Dict:
+    """Read the saves manifest ({filename: summary + mtime}), empty if missing or unreadable"""
+    try:
+        with open(SAVES_MANIFEST, "rb") as f:
+            return orjson.loads(f.read())
+    except (OSError, orjson.JSONDecodeError):
+        return {}
+
+def update_saves_manifest(filename: str, state: Dict):
+    """Record a just-written save in the manifest"""
+    manifest = read_saves_manifest()
+    save_name = os.path.basename(filename)
+
+    if state.get("character"):
+        entry = save_summary(state)
+        previous = manifest.get(save_name)
+        # Only the summary matters for listing; a stale mtime is refreshed by the startup sync
+        if previous is not None and {key: previous.get(key) for key in entry} == entry:
+            return
+        entry["mtime"] = os.stat(filename).st_mtime
+        manifest[save_name] = entry
+    elif save_name in manifest:
+        del manifest[save_name]
+    else:
+        return
 
-def load_game_state(filename: str = "game_state.json"):
+    write_atomic(SAVES_MANIFEST, orjson.dumps(manifest))
+    get_save_files.clear()
+
+def read_save_entry(path: str) -> Optional[Dict]:
+    """Parse a save file into a manifest entry, or None if it isn't a readable character save"""
+    try:
+        mtime = os.stat(path).st_mtime
+        with open(path, "rb") as f:
+            data = orjson.loads(f.read())
+    except (OSError, orjson.JSONDecodeError):
+        return None
+    if not (isinstance(data, dict) and data.get("character")):
+        return None
+    entry = save_summary(data)
+    entry["mtime"] = mtime
+    return entry
+
+@st.cache_resource(show_spinner=False)
+def sync_saves_manifest() -> bool:
+    """Bring the manifest in line with SAVES_DIR once per process, re-reading only saves whose mtime changed"""
+    manifest = read_saves_manifest()
+    synced = {}
+    stale_paths = []
+    for path in glob.glob(os.path.join(SAVES_DIR, "*.json")):
+        save_name = os.path.basename(path)
+        entry = manifest.get(save_name)
+        if entry is not None and entry.get("mtime") == os.stat(path).st_mtime:
+            synced[save_name] = entry
+        else:
+            stale_paths.append(path)
+
+    # Re-read stale saves in parallel; the reads are I/O-bound, so threads overlap the open/read waits
+    if stale_paths:
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            for path, entry in zip(stale_paths, executor.map(read_save_entry, stale_paths)):
+                if entry is not None:
+                    synced[os.path.basename(path)] = entry
+
+    if synced != manifest:
+        write_atomic(SAVES_MANIFEST, orjson.dumps(synced))
+    return True
+
+def save_game_state(filename: str = AUTOSAVE_FILE):
+    """Save game state to a specific file"""
+    # default=list serializes the log deques as plain JSON arrays
+    payload = orjson.dumps(st.session_state.game_state, default=list)
+
+    # Several code paths save back-to-back; skip the write when nothing changed since the last one
+    last_save_hashes = st.session_state.setdefault("last_save_hashes", {})
+    payload_hash = hash(payload)
+    if last_save_hashes.get(filename) == payload_hash and os.path.exists(filename):
+        return
+
+    write_atomic(filename, payload)
+    update_saves_manifest(filename, st.session_state.game_state)
+    last_save_hashes[filename] = payload_hash
+
+# Actions only mark the state dirty; the end of each script run writes it once, so an action that
+# logs, discovers a location and updates stats costs one autosave instead of several
+def mark_dirty():
+    """Flag the game state for the end-of-run autosave"""
+    st.session_state["state_dirty"] = True
+
+def flush_game_state():
+    """Autosave the game state if anything marked it dirty during this run"""
+    if st.session_state.pop("state_dirty", False):
+        save_game_state()
+
+def load_game_state(filename: str = AUTOSAVE_FILE):
     """Load game state from a specific file"""
     if os.path.exists(filename):
         try:
-            with open(filename, "r") as f:
-                loaded_state = json.load(f)
+            with open(filename, "rb") as f:
+                loaded_state = orjson.loads(f.read())
                 if "character" in loaded_state and "current_location" in loaded_state:
-                    st.session_state.game_state = loaded_state
+                    st.session_state.game_state = bound_logs(split_quests(loaded_state))
+                    # The narration conversation belongs to the previous game
+                    st.session_state.pop("sonnet_history", None)
                     return True
-        except:
+        except (OSError, orjson.JSONDecodeError):
             pass
     return False
 
-def get_save_files():
-    """Get list of all save game files"""
-    import glob
-    saves = glob.glob("*.json")
-    # Filter to only game save files (those with character data)
-    game_saves = []
-    for save in saves:
-        try:
-            with open(save, "r") as f:
-                data = json.load(f)
-                if "character" in data and data["character"]:
-                    game_saves.append(save)
-        except:
-            pass
-    return game_saves
+# Short TTL so reruns hit the cache; saves made here clear it immediately via update_saves_manifest
+@st.cache_data(ttl=5, show_spinner=False)
+def get_save_files() -> Dict[str, Dict]:
+    """Get all save game files, mapped to their manifest summaries"""
+    sync_saves_manifest()
+    manifest = read_saves_manifest()
+    return {os.path.join(SAVES_DIR, save_name): manifest[save_name] for save_name in sorted(manifest)}
 
+# Logging only appends; callers mark the state dirty once the whole action has been applied
 def log_story(event: str):
     timestamp = datetime.now().strftime("%H:%M:%S")
     st.session_state.game_state["story_log"].append(f"[{timestamp}] {event}")
-    save_game_state()
 
 def log_combat(event: str):
     timestamp = datetime.now().strftime("%H:%M:%S")
     st.session_state.game_state["combat_log"].append(f"[{timestamp}] {event}")
-    save_game_state()
+
+# API/IO failures are recorded here (and shown in the sidebar) instead of disappearing behind fallbacks
+ERROR_LOG_MAX_ENTRIES = 50
+
+def log_error(source: str, error: Exception):
+    timestamp = datetime.now().strftime("%H:%M:%S")
+    error_log = st.session_state.setdefault("error_log", deque(maxlen=ERROR_LOG_MAX_ENTRIES))
+    error_log.append(f"[{timestamp}] {source}: {type(error).__name__}: {error}")
+
+class LRUCache:
+    """Thread-safe LRU keyed on tuples, used for model replies and synthesized audio"""
+
+    def __init__(self, maxsize: int = 256, ttl: Optional[float] = None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: tuple):
+        with self._lock:
+            if key not in self._entries:
+                return None
+            value, expires = self._entries[key]
+            if expires is not None and expires < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def put(self, key: tuple, value):
+        with self._lock:
+            expires = time.monotonic() + self.ttl if self.ttl is not None else None
+            self._entries[key] = (value, expires)
+            self._entries.move_to_end(key)
+            if len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
 
 # Create audio cache directory
 AUDIO_CACHE_DIR = "audio_cache"
+AUDIO_CACHE_MAX_BYTES = 500_000_000
 if not os.path.exists(AUDIO_CACHE_DIR):
     os.makedirs(AUDIO_CACHE_DIR)
 
-def generate_tts_audio(text: str, text_hash: str) -> str:
+# Voice settings - every one of these changes the synthesized audio, so all are part of the cache key
+TTS_LANGUAGE = "en-US"
+TTS_VOICE_NAME = "en-US-Neural2-D"  # Natural, conversational male voice
+TTS_SPEAKING_RATE = 0.95  # Slightly slower for better clarity
+TTS_PITCH = 0.0
+TTS_VOLUME_GAIN_DB = 0.0
+TTS_ENCODING = "MP3"
+
+# Markdown the voice would read out or stumble on: code blocks, heading/bullet markers, emphasis runs
+MARKDOWN_FOR_SPEECH = re.compile(r'```[^`]*```|^[ \t]*(?:#+|[-*+])[ \t]+|[*_#]+', re.M)
+
+def clean_tts_text(text: str) -> str:
+    """Clean text for speech (remove markdown formatting) in a single pass"""
+    return MARKDOWN_FOR_SPEECH.sub('', text)
+
+# Voice settings are fixed per process, so their part of the cache key is encoded once
+TTS_SETTINGS_KEY = f"{TTS_VOICE_NAME}|{TTS_LANGUAGE}|{TTS_SPEAKING_RATE}|{TTS_PITCH}|{TTS_VOLUME_GAIN_DB}|{TTS_ENCODING}|".encode()
+
+def tts_cache_key(text: str) -> str:
+    """Cache key covering the spoken text (whitespace-normalized) and every voice setting"""
+    key = hashlib.blake2b(TTS_SETTINGS_KEY, digest_size=16)
+    key.update(" ".join(clean_tts_text(text).split()).encode())
+    return key.hexdigest()
+
+# A sentence ends at terminal punctuation followed by whitespace, except after a title like "Dr."
+SENTENCE_END = re.compile(r'(?<!\bMr)(?<!\bMrs)(?<!\bMs)(?<!\bDr)(?<!\bSt)[.!?]\s')
+# Shorter sentences ("Run!") are joined to the next so each clip is worth its own TTS request
+MIN_SPEECH_SEGMENT_CHARS = 10
+
+def split_sentences(buffer: str):
+    """Split complete sentences off the front of buffer, returning them and the unfinished rest"""
+    sentences = []
+    start = 0
+    for match in SENTENCE_END.finditer(buffer):
+        sentence = buffer[start:match.end()].strip()
+        if len(sentence) >= MIN_SPEECH_SEGMENT_CHARS:
+            sentences.append(sentence)
+            start = match.end()
+    return sentences, buffer[start:]
+
+def speech_segments(text: str) -> List[str]:
+    """Sentences of text as they are synthesized and cached, one clip each"""
+    sentences, rest = split_sentences(text)
+    if rest.strip():
+        sentences.append(rest.strip())
+    return [sentence for sentence in sentences if clean_tts_text(sentence).strip()]
+
+def prune_audio_cache(max_bytes: int = AUDIO_CACHE_MAX_BYTES):
+    """Delete least recently used cached audio until the cache fits in max_bytes"""
+    entries = []
+    total_bytes = 0
+    with os.scandir(AUDIO_CACHE_DIR) as it:
+        for entry in it:
+            if entry.name.endswith(".mp3"):
+                stat = entry.stat()
+                entries.append((stat.st_atime, stat.st_size, entry.path))
+                total_bytes += stat.st_size
+
+    for _, size, path in sorted(entries):
+        if total_bytes <= max_bytes:
+            break
+        os.remove(path)
+        sidecar = path[:-len(".mp3")] + ".json"
+        if os.path.exists(sidecar):
+            os.remove(sidecar)
+        total_bytes -= size
+
+@st.cache_resource(show_spinner=False)
+def prune_audio_cache_on_startup() -> bool:
+    """Run the audio cache sweep once per server process rather than on every rerun"""
+    prune_audio_cache()
+    return True
+
+prune_audio_cache_on_startup()
+
+def generate_tts_audio(text: str, cache_key: str) -> str:
     """Generate audio using Google Cloud TTS and cache it"""
-    import hashlib
-
-    if tts_client is None:
-        raise Exception("TTS client not initialized. Please configure Google Cloud credentials.")
-
-    cache_file = os.path.join(AUDIO_CACHE_DIR, f"{text_hash}.mp3")
+    cache_file = os.path.join(AUDIO_CACHE_DIR, f"{cache_key}.mp3")
 
     # Return cached audio if it exists
     if os.path.exists(cache_file):
+        # Refresh the access time ourselves; noatime/relatime mounts won't, and the LRU sweep relies on it
+        os.utime(cache_file)
         return cache_file
 
-    # Clean text for speech (remove markdown formatting)
-    clean_text = text.replace('**', '').replace('*', '').replace('#', '').replace('_', '')
+    from google.cloud import texttospeech
+    clean_text = clean_tts_text(text)
 
     # Configure the TTS request
     synthesis_input = texttospeech.SynthesisInput(text=clean_text)
 
     # Build the voice request - using a high-quality neural voice
     voice = texttospeech.VoiceSelectionParams(
-        language_code="en-US",
-        name="en-US-Neural2-D",  # Natural, conversational male voice
+        language_code=TTS_LANGUAGE,
+        name=TTS_VOICE_NAME,
         ssml_gender=texttospeech.SsmlVoiceGender.MALE
     )
 
     # Select the audio encoding
     audio_config = texttospeech.AudioConfig(
-        audio_encoding=texttospeech.AudioEncoding.MP3,
-        speaking_rate=0.95,  # Slightly slower for better clarity
-        pitch=0.0,
-        volume_gain_db=0.0
+        audio_encoding=texttospeech.AudioEncoding[TTS_ENCODING],
+        speaking_rate=TTS_SPEAKING_RATE,
+        pitch=TTS_PITCH,
+        volume_gain_db=TTS_VOLUME_GAIN_DB
     )
 
     # Perform the text-to-speech request
-    response = tts_client.synthesize_speech(
+    response = get_tts_client().synthesize_speech(
         input=synthesis_input,
         voice=voice,
         audio_config=audio_config
     )
 
-    # Save the audio to cache
-    with open(cache_file, "wb") as out:
+    # Save the audio to cache (write then rename, since background pre-warming may read it concurrently)
+    tmp_file = f"{cache_file}.{threading.get_ident()}.tmp"
+    with open(tmp_file, "wb") as out:
         out.write(response.audio_content)
+    os.replace(tmp_file, cache_file)
+
+    # Sidecar metadata so cache sweeps can expire entries without decoding audio
+    with open(os.path.join(AUDIO_CACHE_DIR, f"{cache_key}.json"), "wb") as meta:
+        meta.write(orjson.dumps({
+            "created": time.time(),
+            "voice": TTS_VOICE_NAME,
+            "language": TTS_LANGUAGE,
+            "rate": TTS_SPEAKING_RATE,
+            "pitch": TTS_PITCH,
+            "bytes": len(response.audio_content)
+        }))
 
     return cache_file
 
-def speak_text(text: str, button_key: str):
+@st.cache_resource(show_spinner=False)
+def get_tts_executor() -> ThreadPoolExecutor:
+    """Process-wide worker pool for background speech synthesis"""
+    return ThreadPoolExecutor(max_workers=4)
+
+@st.cache_resource(show_spinner=False)
+def warm_tts_client() -> Future:
+    """Build the TTS client in the background once, so the first narration doesn't pay for the gRPC setup"""
+    # A failed construction isn't cached by get_tts_client, so the next real request retries and reports it
+    return get_tts_executor().submit(get_tts_client)
+
+@st.cache_resource(show_spinner=False)
+def get_audio_memory_cache() -> LRUCache:
+    """In-memory tier in front of the disk cache: recently played clips skip the file read entirely"""
+    return LRUCache(maxsize=128)
+
+def synthesize_segment(segment: str) -> bytes:
+    """Audio for one sentence: memory cache, then disk cache, then Google Cloud TTS"""
+    cache_key = tts_cache_key(segment)
+    audio = get_audio_memory_cache().get((cache_key,))
+    if audio is None:
+        with open(generate_tts_audio(segment, cache_key), "rb") as f:
+            audio = f.read()
+        get_audio_memory_cache().put((cache_key,), audio)
+    return audio
+
+def prewarm_tts_stream(chunks: Iterator[str]) -> Iterator[str]:
+    """Pass streamed text through, queueing synthesis for each sentence as soon as it completes"""
+    executor = get_tts_executor()
+    buffer = ""
+    for chunk in chunks:
+        yield chunk
+        buffer += chunk
+        sentences, buffer = split_sentences(buffer)
+        for sentence in sentences:
+            if clean_tts_text(sentence).strip():
+                executor.submit(synthesize_segment, sentence)
+    if clean_tts_text(buffer).strip():
+        executor.submit(synthesize_segment, buffer.strip())
+
+@st.cache_resource(show_spinner=False)
+def get_playback_executor() -> ThreadPoolExecutor:
+    """Workers that assemble a clicked narration's audio, so the click doesn't block the rerun"""
+    # Separate from the synthesis pool: these jobs wait on synthesis jobs and would deadlock sharing it
+    return ThreadPoolExecutor(max_workers=2)
+
+def is_speech_cached(text: str) -> bool:
+    """Whether every sentence of text already has audio in the memory or disk cache"""
+    for segment in speech_segments(text):
+        cache_key = tts_cache_key(segment)
+        cache_file = os.path.join(AUDIO_CACHE_DIR, f"{cache_key}.mp3")
+        if get_audio_memory_cache().get((cache_key,)) is None and not os.path.exists(cache_file):
+            return False
+    return True
+
+def synthesize_text(text: str) -> bytes:
+    """Audio for a whole narration, one clip per sentence (pre-warmed ones are cache hits)"""
+    clips = get_tts_executor().map(synthesize_segment, speech_segments(text))
+    # MP3 frames concatenate cleanly, so the clips play back as one track
+    return b"".join(clips)
+
+@st.fragment(run_every=0.5)
+def await_pending_audio(unique_key: str):
+    """Poll a narration's synthesis and rerun the app to play it once it is ready"""
+    future = st.session_state["pending_audio"].get(unique_key)
+    if future is None or future.done():
+        st.rerun()
+    st.caption("🔊 Preparing audio...")
+
+def speak_text(text: str, button_key: str = ""):
     """Display text with a TTS button using Google Cloud TTS"""
-    import hashlib
-
-    # Create unique key for this text
-    text_hash = hashlib.md5(text.encode()).hexdigest()[:8]
-    unique_key = f"tts_{button_key}_{text_hash}"
+    # The widget key comes from the text itself; button_key only separates identical text shown twice on a page
+    cache_key = tts_cache_key(text)
+    unique_key = f"tts_{button_key}_{cache_key}"
 
     col1, col2 = st.columns([0.95, 0.05])
 
@@ -199,59 +583,244 @@ def speak_text(text: str, button_key: str):
 
     with col2:
         # Create button that triggers TTS
-        if st.button("🔊", key=unique_key, help="Read aloud"):
-            try:
-                # Generate or retrieve cached audio
-                audio_file = generate_tts_audio(text, text_hash)
-
-                # Read the audio file and encode as base64
-                with open(audio_file, "rb") as f:
-                    audio_bytes = f.read()
-                    audio_base64 = base64.b64encode(audio_bytes).decode()
-
-                # Display audio player
-                audio_html = f"""
-                <audio autoplay>
-                    <source src="data:audio/mp3;base64,{audio_base64}" type="audio/mp3">
-                </audio>
-                """
-                st.markdown(audio_html, unsafe_allow_html=True)
-            except Exception as e:
-                st.error(f"TTS Error: {str(e)}")
+        read_aloud = st.button("🔊", key=unique_key, help="Read aloud")
+
+    # Synthesis runs in the background and the clip plays on the first rerun after it finishes.
+    # Fully cached narration (short interjections, replays, pre-warmed text) skips the round trip.
+    pending_audio = st.session_state.setdefault("pending_audio", {})
+    future = pending_audio.get(unique_key)
+    if future is None:
+        if not read_aloud:
+            return
+        if not is_speech_cached(text):
+            future = pending_audio[unique_key] = get_playback_executor().submit(synthesize_text, text)
+    if future is not None and not future.done():
+        await_pending_audio(unique_key)
+        return
+
+    pending_audio.pop(unique_key, None)
+    from google.api_core import exceptions as google_exceptions
+    try:
+        audio = future.result() if future is not None else synthesize_text(text)
+        st.audio(audio, format="audio/mp3", autoplay=True)
+    except (google_exceptions.GoogleAPICallError, RuntimeError, OSError) as e:
+        log_error("TTS", e)
+        st.error(f"TTS Error: {str(e)}")
+
+# ============== MODEL STREAMING ==============
+@st.cache_resource(show_spinner=False)
+def get_reply_cache() -> LRUCache:
+    """Process-wide reply cache (module globals are rebuilt on every Streamlit rerun)"""
+    # Only for calls where repeating a reply is correct (rules adjudication opts in with use_cache=True).
+    # The TTL just keeps rulings from going stale on long-running servers.
+    return LRUCache(ttl=REPLY_CACHE_TTL_SECONDS)
+
+def sonnet_system_blocks() -> List[Dict]:
+    """Style guide plus the campaign's world, cached server-side as one static prefix"""
+    blocks = [{"type": "text", "text": SONNET_SYSTEM_PROMPT}]
+    world_context = st.session_state.game_state.get("world_context")
+    if world_context:
+        blocks.append({"type": "text", "text": f"The world of this campaign:\n\n{world_context}"})
+    blocks[-1]["cache_control"] = {"type": "ephemeral"}
+    return blocks
+
+def sonnet_messages(prompt: str, use_history: bool) -> List[Dict]:
+    """Conversation to send: recent exchanges (if any) followed by the new prompt"""
+    messages = []
+    if use_history:
+        for user_turn, assistant_turn in st.session_state.get("sonnet_history", []):
+            messages.append({"role": "user", "content": user_turn})
+            messages.append({"role": "assistant", "content": assistant_turn})
+    if messages:
+        # Cache breakpoint at the end of the previous exchange so the whole conversation so far is reused
+        messages[-1]["content"] = [{
+            "type": "text",
+            "text": messages[-1]["content"],
+            "cache_control": {"type": "ephemeral"}
+        }]
+    messages.append({"role": "user", "content": prompt})
+    return messages
+
+def stream_sonnet(system: List[Dict], messages: List[Dict], max_tokens: int) -> Iterator[str]:
+    """Stream Sonnet's reply text as it is generated"""
+    with get_sonnet_client(ANTHROPIC_API_KEY).messages.stream(
+        model=SONNET_MODEL,
+        max_tokens=max_tokens,
+        system=system,
+        messages=messages
+    ) as stream:
+        for text in stream.text_stream:
+            yield text
+
+class GeminiLimiter:
+    """Token bucket that keeps Gemini requests under the per-minute quota"""
+
+    def __init__(self, rpm: int = GEMINI_REQUESTS_PER_MINUTE):
+        self.capacity = rpm
+        self.tokens = float(rpm)
+        self.rate = rpm / 60
+        self.last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """Take one request token, sleeping until the bucket refills if it is empty"""
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.last) * self.rate)
+            self.last = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return
+            # Sleep while holding the lock so waiting callers are released one at a time
+            time.sleep((1 - self.tokens) / self.rate)
+            self.tokens = 0.0
+            self.last = time.monotonic()
+
+@st.cache_resource(show_spinner=False)
+def get_gemini_limiter() -> GeminiLimiter:
+    """Process-wide limiter shared by every session"""
+    return GeminiLimiter()
+
+@st.cache_resource(show_spinner=False)
+def get_gemini_retry() -> "google_retry.Retry":
+    """Back off exponentially (with jitter) when Gemini reports the quota is exhausted"""
+    # google.api_core imports gRPC, so it is loaded with the Gemini SDK rather than at startup
+    from google.api_core import exceptions as google_exceptions
+    from google.api_core import retry as google_retry
+    return google_retry.Retry(
+        predicate=google_retry.if_exception_type(google_exceptions.ResourceExhausted),
+        initial=1.0,
+        maximum=30.0,
+        multiplier=2.0,
+        timeout=120.0
+    )
+
+def start_gemini_stream(prompt: str):
+    """Start a rate-limited streaming Gemini request"""
+    get_gemini_limiter().acquire()
+    return get_gemini_client(GEMINI_API_KEY).generate_content(prompt, stream=True)
+
+def open_gemini_stream(prompt: str):
+    """Start a Gemini stream, retrying while the quota is exhausted"""
+    return get_gemini_retry()(start_gemini_stream)(prompt)
+
+def stream_gemini(prompt: str) -> Iterator[str]:
+    """Stream Gemini's reply text as it is generated"""
+    for chunk in open_gemini_stream(prompt):
+        yield chunk.text
+
+def remember_sonnet_turn(prompt: str, reply: str):
+    """Append an exchange to the session's Sonnet conversation, evicting the oldest half once it is full"""
+    history = st.session_state.setdefault("sonnet_history", [])
+    # Evict in blocks rather than sliding one turn at a time: a sliding window changes the message
+    # prefix on every request, so the prompt cache breakpoint on the last exchange would never hit
+    if len(history) >= SONNET_HISTORY_TURNS:
+        del history[:SONNET_HISTORY_TURNS // 2]
+    history.append((prompt, reply))
+
+def ask_sonnet(prompt: str, max_tokens: int, placeholder: Optional[DeltaGenerator] = None,
+               use_history: bool = True) -> str:
+    """Get Sonnet's full reply, rendering it live into placeholder while it streams"""
+    # Never cached: every Sonnet call is generative, and a repeated prompt should get a fresh reply
+    system = sonnet_system_blocks()
+
+    import anthropic
+    chunks = stream_sonnet(system, sonnet_messages(prompt, use_history), max_tokens)
+    try:
+        if placeholder is None:
+            text = "".join(chunks)
+        else:
+            if TTS_AVAILABLE and st.session_state.game_state.get("tts_enabled", False):
+                chunks = prewarm_tts_stream(chunks)
+            text = placeholder.container().write_stream(chunks)
+            # The caller renders the final text (with its TTS button), so drop the preview
+            placeholder.empty()
+    except anthropic.APIError as e:
+        log_error("Sonnet", e)
+        raise
+
+    if use_history:
+        remember_sonnet_turn(prompt, text)
+    return text
+
+def ask_gemini(prompt: str, use_cache: bool = False, log_errors: bool = True) -> str:
+    """Get Gemini's full reply, accumulated from the stream for JSON parsing"""
+    # Opt-in cache: only for calls where repeating a reply is correct, since it is shared by every session
+    cache_key = ("gemini", prompt)
+    if use_cache:
+        cached = get_reply_cache().get(cache_key)
+        if cached is not None:
+            return cached
+
+    from google.api_core import exceptions as google_exceptions
+    try:
+        text = "".join(stream_gemini(prompt))
+    except (google_exceptions.GoogleAPICallError, google_exceptions.RetryError) as e:
+        # API failures (bad key, 5xx, permissions) or still rate-limited after the whole retry window
+        if log_errors:
+            log_error("Gemini", e)
+        raise
+    if use_cache:
+        get_reply_cache().put(cache_key, text)
+    return text
+
+# Outermost {...} span of a reply, skipping any ```json fences or chatter around it
+JSON_OBJECT = re.compile(r'\{.*\}', re.S)
+
+def parse_model_json(text: str):
+    """Parse the JSON object embedded in a model reply"""
+    match = JSON_OBJECT.search(text)
+    return orjson.loads(match.group() if match else text)
 
 # ============== DICE ROLLING & MECHANICS (GEMINI) ==============
-def roll_dice(dice_notation: str) -> Dict:
-    """Roll dice and return results (e.g., '2d6', '1d20+5')"""
-    parts = dice_notation.lower().replace(" ", "").split('d')
-    num_dice = int(parts[0]) if parts[0] else 1
-
-    modifier = 0
-    if '+' in parts[1]:
-        die_size, mod = parts[1].split('+')
-        modifier = int(mod)
-    elif '-' in parts[1]:
-        die_size, mod = parts[1].split('-')
-        modifier = -int(mod)
-    else:
-        die_size = parts[1]
+# Dice notation: [count]d<sides> followed by any number of +/- modifiers, spaces allowed
+DICE_NOTATION = re.compile(r'^\s*(\d*)\s*d\s*(\d+)((?:\s*[+-]\s*\d+)*)\s*$', re.I)
+DICE_MODIFIER = re.compile(r'([+-])\s*(\d+)')
+dice_rng = np.random.default_rng()
+# Upper bound on dice per roll, so model-supplied notation like "1000000000d6" can't allocate a huge array
+MAX_DICE_PER_ROLL = 100
+
+class DiceSpec:
+    """Parsed dice notation (count, die size, flat modifier) that can be rolled repeatedly"""
+
+    def __init__(self, dice_notation: str):
+        match = DICE_NOTATION.match(dice_notation)
+        if match is None:
+            raise ValueError(f"Invalid dice notation: {dice_notation}")
+
+        self.notation = dice_notation
+        self.num_dice = int(match.group(1)) if match.group(1) else 1
+        self.die_size = int(match.group(2))
+        self.modifier = sum(int(value) if sign == '+' else -int(value)
+                            for sign, value in DICE_MODIFIER.findall(match.group(3)))
+        if self.die_size < 1 or not 1 <= self.num_dice <= MAX_DICE_PER_ROLL:
+            raise ValueError(f"Invalid dice notation: {dice_notation}")
+
+    def roll(self) -> Dict:
+        """Roll the dice and return the individual rolls, modifier and total"""
+        # One vectorized draw for all dice instead of a Python-level loop per die
+        rolls = dice_rng.integers(1, self.die_size + 1, size=self.num_dice).tolist()
+        return {
+            "notation": self.notation,
+            "rolls": rolls,
+            "modifier": self.modifier,
+            "total": sum(rolls) + self.modifier
+        }
 
-    die_size = int(die_size)
-    rolls = [random.randint(1, die_size) for _ in range(num_dice)]
-    total = sum(rolls) + modifier
+# Fleeing and the Perform Action fallback use a plain d20 (rebuilt each rerun like every module global, one
+# regex match); combat rounds draw all their dice at once from COMBAT_ROUND_DIE_SIZES
+D20 = DiceSpec("1d20")
+# Attack d20, damage d8, counterattack d20, counterattack damage d6
+COMBAT_ROUND_DIE_SIZES = np.array([20, 8, 20, 6])
 
-    return {
-        "notation": dice_notation,
-        "rolls": rolls,
-        "modifier": modifier,
-        "total": total
-    }
+def roll_dice(dice_notation: str) -> Dict:
+    """Roll dice and return results (e.g., '2d6', '1d20+5', '3d6-2+1')"""
+    return DiceSpec(dice_notation).roll()
 
-def adjudicate_action(action: str, character_stats: Dict, difficulty: str) -> Dict:
-    """Use Gemini to adjudicate player actions based on rules"""
-    prompt = f"""You are the rules engine for a fantasy TTRPG. Adjudicate this action:
+ADJUDICATE_PROMPT = """You are the rules engine for a fantasy TTRPG. Adjudicate this action:
 
 Action: {action}
-Character Stats: {json.dumps(character_stats)}
+Character Stats: {character_stats}
 Difficulty: {difficulty}
 
 Provide a JSON response with:
@@ -263,10 +832,19 @@ Provide a JSON response with:
 
 Return ONLY valid JSON, no markdown formatting."""
 
-    response = gemini_client.generate_content(prompt)
+def adjudicate_action(action: str, character_stats: Dict, difficulty: str) -> Dict:
+    """Use Gemini to adjudicate player actions based on rules"""
+    prompt = ADJUDICATE_PROMPT.format_map({
+        "action": action,
+        "character_stats": orjson.dumps(character_stats).decode(),
+        "difficulty": difficulty
+    })
+
     try:
-        return json.loads(response.text.strip().replace('```json', '').replace('```', ''))
-    except:
+        # The only cached model call: the same action against the same stats should get the same ruling
+        return parse_model_json(ask_gemini(prompt, use_cache=True))
+    # Covers unparseable JSON (orjson.JSONDecodeError) and blocked or text-less Gemini streams
+    except ValueError:
         return {
             "required_roll": "1d20",
             "difficulty_class": 10,
@@ -276,9 +854,7 @@ Return ONLY valid JSON, no markdown formatting."""
         }
 
 # ============== CHARACTER CREATION ==============
-def create_character(name: str, character_class: str) -> Dict:
-    """Use Gemini to generate balanced character stats"""
-    prompt = f"""Generate starting stats for a {character_class} character named {name} in a fantasy TTRPG.
+CHARACTER_PROMPT = """Generate starting stats for a {character_class} character named {name} in a fantasy TTRPG.
 
 Use this stat system:
 - HP (Health Points): 20-50
@@ -305,11 +881,15 @@ Return ONLY valid JSON with this structure:
   "abilities": ["ability1", "ability2", "ability3"]
 }}"""
 
-    response = gemini_client.generate_content(prompt)
+def create_character(name: str, character_class: str) -> Dict:
+    """Use Gemini to generate balanced character stats"""
+    prompt = CHARACTER_PROMPT.format_map({"name": name, "character_class": character_class})
+
     try:
-        character = json.loads(response.text.strip().replace('```json', '').replace('```', ''))
+        # Runs on a worker thread with no Streamlit session, so Begin Adventure logs failures itself
+        character = parse_model_json(ask_gemini(prompt, log_errors=False))
         return character
-    except:
+    except ValueError:
         return {
             "name": name,
             "class": character_class,
@@ -325,9 +905,7 @@ Return ONLY valid JSON with this structure:
         }
 
 # ============== WORLD BUILDING (SONNET) ==============
-def generate_world_intro() -> str:
-    """Generate initial world setting and premise"""
-    prompt = """You are a creative game master for a dark fantasy TTRPG called Voidwalkers.
+WORLD_INTRO_PROMPT = """You are a creative game master for a dark fantasy TTRPG called Voidwalkers.
 
 Generate an intriguing opening that:
 1. Describes a unique, atmospheric fantasy world
@@ -337,18 +915,13 @@ Generate an intriguing opening that:
 
 Make it compelling and mysterious."""
 
-    message = sonnet_client.messages.create(
-        model="claude-sonnet-4-20250514",
-        max_tokens=1500,
-        messages=[{"role": "user", "content": prompt}]
-    )
-    return message.content[0].text
-
-def generate_location(location_type: str, context: str) -> Dict:
-    """Generate a new location with Sonnet"""
-    prompt = f"""Generate a {location_type} location for a dark fantasy TTRPG.
+def generate_world_intro(placeholder: Optional[DeltaGenerator] = None) -> str:
+    """Generate initial world setting and premise"""
+    # Every new game should get a fresh world, so this prompt is never served from cache;
+    # the result reaches later calls through the system prompt rather than the conversation
+    return ask_sonnet(WORLD_INTRO_PROMPT, 1500, placeholder, use_history=False)
 
-World Context: {context}
+LOCATION_PROMPT = """Generate a {location_type} location for a dark fantasy TTRPG, set in this campaign's world.
 
 Provide:
 1. Name of the location
@@ -359,13 +932,11 @@ Provide:
 
 Be creative and atmospheric."""
 
-    message = sonnet_client.messages.create(
-        model="claude-sonnet-4-20250514",
-        max_tokens=1500,
-        messages=[{"role": "user", "content": prompt}]
-    )
+def generate_location(location_type: str, placeholder: Optional[DeltaGenerator] = None) -> Dict:
+    """Generate a new location with Sonnet (the world context travels in the system prompt)"""
+    prompt = LOCATION_PROMPT.format_map({"location_type": location_type})
 
-    description = message.content[0].text
+    description = ask_sonnet(prompt, 1500, placeholder)
 
     # Extract a name from the description (simple approach)
     lines = description.split('\n')
@@ -380,12 +951,10 @@ Be creative and atmospheric."""
 
     st.session_state.game_state["locations"].append(location)
     log_story(f"Discovered new location: {name}")
-    save_game_state()
+    mark_dirty()
     return location
 
-def generate_npc(role: str, location: str) -> Dict:
-    """Generate an NPC with Sonnet"""
-    prompt = f"""Create an NPC for a dark fantasy TTRPG.
+NPC_PROMPT = """Create an NPC for a dark fantasy TTRPG.
 
 Role: {role}
 Location: {location}
@@ -399,13 +968,12 @@ Provide:
 
 Be memorable and nuanced."""
 
-    message = sonnet_client.messages.create(
-        model="claude-sonnet-4-20250514",
-        max_tokens=1200,
-        messages=[{"role": "user", "content": prompt}]
-    )
+def generate_npc(role: str, location: str,
+                 placeholder: Optional[DeltaGenerator] = None) -> Dict:
+    """Generate an NPC with Sonnet"""
+    prompt = NPC_PROMPT.format_map({"role": role, "location": location})
 
-    description = message.content[0].text
+    description = ask_sonnet(prompt, 1200, placeholder)
     lines = description.split('\n')
     name = lines[0].strip('#* ') if lines else f"The {role}"
 
@@ -419,12 +987,10 @@ Be memorable and nuanced."""
 
     st.session_state.game_state["npcs"].append(npc)
     log_story(f"Met {name}, a {role}")
-    save_game_state()
+    mark_dirty()
     return npc
 
-def generate_quest(context: str) -> Dict:
-    """Generate a quest with Sonnet"""
-    prompt = f"""Create a quest for a dark fantasy TTRPG.
+QUEST_PROMPT = """Create a quest for a dark fantasy TTRPG.
 
 Current Context: {context}
 
@@ -437,13 +1003,11 @@ Generate:
 
 Make it engaging with moral complexity."""
 
-    message = sonnet_client.messages.create(
-        model="claude-sonnet-4-20250514",
-        max_tokens=1200,
-        messages=[{"role": "user", "content": prompt}]
-    )
+def generate_quest(context: str, placeholder: Optional[DeltaGenerator] = None) -> Dict:
+    """Generate a quest with Sonnet"""
+    prompt = QUEST_PROMPT.format_map({"context": context})
 
-    description = message.content[0].text
+    description = ask_sonnet(prompt, 1200, placeholder)
     lines = description.split('\n')
     title = lines[0].strip('#* ') if lines else "A New Quest"
 
@@ -454,15 +1018,13 @@ Make it engaging with moral complexity."""
         "objectives": []
     }
 
-    st.session_state.game_state["quests"].append(quest)
+    st.session_state.game_state["active_quests"].append(quest)
     log_story(f"New quest: {title}")
-    save_game_state()
+    mark_dirty()
     return quest
 
 # ============== ENCOUNTERS & COMBAT ==============
-def generate_encounter(encounter_type: str, character_level: int) -> Dict:
-    """Use Gemini to generate balanced combat encounters"""
-    prompt = f"""Generate a {encounter_type} encounter for a level {character_level} character in a dark fantasy setting.
+ENCOUNTER_PROMPT = """Generate a {encounter_type} encounter for a level {character_level} character in a dark fantasy setting.
 
 Include:
 1. Enemy name and description
@@ -482,11 +1044,14 @@ Return ONLY valid JSON:
   "loot": ["item1", "item2"]
 }}"""
 
-    response = gemini_client.generate_content(prompt)
+def generate_encounter(encounter_type: str, character_level: int) -> Dict:
+    """Use Gemini to generate balanced combat encounters"""
+    prompt = ENCOUNTER_PROMPT.format_map({"encounter_type": encounter_type, "character_level": character_level})
+
     try:
-        encounter = json.loads(response.text.strip().replace('```json', '').replace('```', ''))
+        encounter = parse_model_json(ask_gemini(prompt))
         return encounter
-    except:
+    except ValueError:
         return {
             "name": "Void Creature",
             "description": "A shadowy beast from the void",
@@ -498,62 +1063,60 @@ Return ONLY valid JSON:
             "loot": ["Void Essence"]
         }
 
-def narrate_event(event: str, context: str) -> str:
-    """Use Sonnet to narrate game events dramatically"""
-    prompt = f"""You are the narrator for a dark fantasy TTRPG called Voidwalkers.
+NARRATE_PROMPT = """You are the narrator for a dark fantasy TTRPG called Voidwalkers.
 
 Event: {event}
 Context: {context}
 
 Narrate this event in 2-3 vivid, atmospheric sentences. Make it engaging and immersive."""
 
-    message = sonnet_client.messages.create(
-        model="claude-sonnet-4-20250514",
-        max_tokens=500,
-        messages=[{"role": "user", "content": prompt}]
-    )
-    return message.content[0].text
+def narrate_event(event: str, context: str,
+                  placeholder: Optional[DeltaGenerator] = None) -> str:
+    """Use Sonnet to narrate game events dramatically"""
+    prompt = NARRATE_PROMPT.format_map({"event": event, "context": context})
 
-def process_combat_round(player_action: str, enemy: Dict, character: Dict) -> str:
-    """Use Gemini for combat mechanics"""
-    prompt = f"""Process a combat round in a fantasy TTRPG.
+    return ask_sonnet(prompt, 500, placeholder)
 
-Player Action: {player_action}
-Player Stats: {json.dumps(character)}
-Enemy Stats: {json.dumps(enemy)}
+def process_combat_round(player_action: str, enemy: Dict, character: Dict) -> Dict:
+    """Resolve a combat round locally with dice rolls (narration is left to Sonnet)"""
+    # One vectorized draw for the whole round; dice for a miss or a dead enemy simply go unused
+    attack_die, damage_die, counter_die, counter_damage_die = dice_rng.integers(1, COMBAT_ROUND_DIE_SIZES + 1).tolist()
 
-Determine:
-1. Does player hit? (roll 1d20 + relevant stat vs enemy defense)
-2. Damage dealt (if hit)
-3. Enemy response/counterattack
-4. Damage to player (if any)
-5. Updated HP for both
+    # Player attacks: 1d20 + strength vs enemy defense, 1d8 damage on a hit
+    attack_roll = attack_die + character.get("strength", 0)
+    player_hit = attack_roll >= enemy["defense"]
+    player_damage = damage_die if player_hit else 0
+    enemy_hp = enemy["hp"] - player_damage
 
-Return ONLY valid JSON:
-{{
-  "player_hit": boolean,
-  "player_damage": number,
-  "enemy_damage": number,
-  "player_hp": number,
-  "enemy_hp": number,
-  "description": "what happened"
-}}"""
+    if player_hit:
+        description = f"You {player_action} the {enemy['name']} (rolled {attack_roll}) and hit for {player_damage} damage."
+    else:
+        description = f"You {player_action} the {enemy['name']} (rolled {attack_roll}) but miss."
+
+    # A surviving enemy counterattacks: 1d20 vs player defense, 1d6 + attack/5 damage on a hit
+    enemy_damage = 0
+    if enemy_hp > 0:
+        if counter_die >= character["defense"]:
+            enemy_damage = counter_damage_die + enemy["attack"] // 5
+            description += f" The {enemy['name']} strikes back for {enemy_damage} damage."
+        else:
+            description += f" The {enemy['name']} strikes back but you evade it."
 
-    response = gemini_client.generate_content(prompt)
-    try:
-        result = json.loads(response.text.strip().replace('```json', '').replace('```', ''))
-        return result
-    except:
-        return {
-            "player_hit": True,
-            "player_damage": random.randint(5, 15),
-            "enemy_damage": random.randint(3, 10),
-            "player_hp": character['hp'] - random.randint(3, 10),
-            "enemy_hp": enemy['hp'] - random.randint(5, 15),
-            "description": "You exchange blows with the enemy!"
-        }
+    return {
+        "player_hit": player_hit,
+        "player_damage": player_damage,
+        "enemy_damage": enemy_damage,
+        "player_hp": character["hp"] - enemy_damage,
+        "enemy_hp": enemy_hp,
+        "description": description
+    }
 
 # ============== STREAMLIT UI ==============
+# Stat-line templates shared by the sidebar, combat and load screens; filled with .format_map(stats)
+PLAYER_HEADER_TMPL = "👤 {name}"
+ENEMY_HEADER_TMPL = "👹 {name}"
+HP_LINE_TMPL = "HP: {hp}/{max_hp}"
+
 st.set_page_config(page_title="Voidwalkers TTRPG", layout="wide")
 st.title("⚔️ Voidwalkers - Procedurally Generated TTRPG")
 
@@ -572,7 +1135,7 @@ with st.sidebar:
         # Health bar
         hp_percent = (char['hp'] / char['max_hp']) * 100
         st.progress(hp_percent / 100)
-        st.write(f"HP: {char['hp']}/{char['max_hp']}")
+        st.write(HP_LINE_TMPL.format_map(char))
 
         # Stats
         st.write("**Stats:**")
@@ -589,6 +1152,15 @@ with st.sidebar:
         for ability in char.get('abilities', []):
             st.write(f"• {ability}")
 
+        game_state["tts_enabled"] = st.toggle(
+            "🔊 Voice narration",
+            value=game_state.get("tts_enabled", False),
+            disabled=not TTS_AVAILABLE,
+            help="Synthesize narration audio sentence by sentence while it is written, so 🔊 plays right away"
+        )
+        if game_state["tts_enabled"]:
+            warm_tts_client()
+
         st.divider()
 
         # Save/Load Section
@@ -600,8 +1172,10 @@ with st.sidebar:
 
         with col_save:
             if st.button("💾 Save", use_container_width=True):
-                if save_name:
-                    filename = f"{save_name.replace(' ', '_')}.json"
+                # Leading dots would make a hidden file that the save list skips (or the manifest itself)
+                file_stem = save_name.replace(' ', '_').lstrip('.')
+                if file_stem:
+                    filename = os.path.join(SAVES_DIR, f"{file_stem}.json")
                     save_game_state(filename)
                     st.success(f"Saved to {filename}!")
                 else:
@@ -617,17 +1191,11 @@ with st.sidebar:
             save_files = get_save_files()
             if save_files:
                 st.write("**Select save file:**")
-                for save_file in save_files:
+                for save_file, save_info in save_files.items():
                     col1, col2 = st.columns([3, 1])
                     with col1:
-                        # Extract character info
-                        try:
-                            with open(save_file, "r") as f:
-                                data = json.load(f)
-                                char_info = f"{data['character']['name']} - Lv{data['character']['level']} {data['character']['class']}"
-                                st.write(f"📄 {save_file}: {char_info}")
-                        except:
-                            st.write(f"📄 {save_file}")
+                        char_info = f"{save_info['name']} - Lv{save_info['level']} {save_info['class']}"
+                        st.write(f"📄 {os.path.basename(save_file)}: {char_info}")
                     with col2:
                         if st.button("Load", key=f"load_{save_file}"):
                             if load_game_state(save_file):
@@ -649,24 +1217,321 @@ with st.sidebar:
         st.divider()
 
         if st.button("🔄 New Game"):
-            st.session_state.game_state = {
+            get_reply_cache().clear()
+            st.session_state.pop("sonnet_history", None)
+            st.session_state.game_state = bound_logs({
                 "character": None,
                 "current_location": None,
                 "inventory": [],
                 "npcs": [],
                 "locations": [],
-                "quests": [],
+                "active_quests": [],
+                "completed_quests": [],
                 "combat_log": [],
                 "story_log": [],
                 "game_started": False,
                 "current_encounter": None,
                 "world_context": ""
-            }
-            save_game_state()
+            })
+            mark_dirty()
             st.rerun()
     else:
         st.info("Create a character to begin")
 
+    if st.session_state.get("error_log"):
+        with st.expander(f"⚠️ Errors ({len(st.session_state['error_log'])})"):
+            for entry in reversed(st.session_state["error_log"]):
+                st.caption(entry)
+
+# ============== GAME TABS ==============
+# Combat and Quests are fragments: clicking their buttons reruns only that tab instead of the whole
+# script (handlers that change shared state still finish with a full st.rerun()). Adventure actions
+# change what the Combat tab and sidebar show, so that tab stays on the full-rerun path.
+def render_adventure_tab():
+    """Exploration, NPCs, encounters and custom actions"""
+    st.header("Current Adventure")
+
+    # Display world context
+    if game_state["world_context"] and not game_state.get("world_shown", False):
+        st.markdown("### 🌍 Welcome to Voidwalkers")
+        speak_text(game_state["world_context"], "world_intro")
+        game_state["world_shown"] = True
+        mark_dirty()
+
+    # Current location
+    if game_state["current_location"]:
+        st.subheader(f"📍 Current Location: {game_state['current_location']}")
+
+        current_loc = next((loc for loc in game_state["locations"]
+                          if loc["name"] == game_state["current_location"]), None)
+        if current_loc:
+            speak_text(current_loc["description"], f"location_{game_state['current_location']}")
+
+    st.divider()
+
+    # Actions
+    st.subheader("What do you do?")
+
+    col1, col2, col3 = st.columns(3)
+
+    with col1:
+        if st.button("🗺️ Explore Area", key="adventure_explore"):
+            with st.spinner("Exploring..."):
+                location_types = ["ruins", "forest", "cave", "shrine", "dungeon"]
+                new_loc = generate_location(
+                    random.choice(location_types),
+                    st.empty()
+                )
+                st.success(f"You discovered: {new_loc['name']}")
+                speak_text(new_loc["description"], f"new_location_{new_loc['name']}")
+
+    with col2:
+        if st.button("👥 Meet Someone", key="adventure_meet"):
+            with st.spinner("Encountering..."):
+                roles = ["merchant", "wanderer", "cultist", "guard", "mysterious figure"]
+                npc = generate_npc(
+                    random.choice(roles),
+                    game_state["current_location"],
+                    st.empty()
+                )
+                st.success(f"You meet: {npc['name']}")
+                speak_text(npc["description"], f"npc_{npc['name']}")
+
+    with col3:
+        if st.button("⚔️ Seek Combat", key="adventure_seek_combat"):
+            with st.spinner("Searching for enemies..."):
+                char_level = game_state["character"]["level"]
+                encounter = generate_encounter("combat", char_level)
+                game_state["current_encounter"] = encounter
+
+                narration = narrate_event(
+                    f"encountered a {encounter['name']}",
+                    game_state["current_location"],
+                    st.empty()
+                )
+
+                st.warning(f"⚔️ Combat Initiated!")
+                # Combine narration and description for TTS
+                combat_intro = f"{narration}\n\n{encounter['name']}. {encounter['description']}"
+                speak_text(combat_intro, f"combat_encounter_{encounter['name']}")
+
+                log_combat(f"Encountered {encounter['name']}")
+                mark_dirty()
+
+    # Custom Action
+    st.divider()
+    custom_action = st.text_input("Or describe your own action:",
+                                  placeholder="I search for hidden passages...")
+
+    if st.button("🎲 Perform Action", key="adventure_action"):
+        if custom_action:
+            with st.spinner("Processing action..."):
+                # Use Gemini to adjudicate
+                judgment = adjudicate_action(
+                    custom_action,
+                    game_state["character"],
+                    "medium"
+                )
+
+                st.write(f"**Action:** {custom_action}")
+                st.write(f"**Required:** {judgment['required_roll']} vs DC {judgment['difficulty_class']}")
+
+                # Roll dice, falling back to a plain d20 if the model's notation can't be rolled (e.g. "1d20+STR")
+                try:
+                    roll_result = roll_dice(judgment['required_roll'])
+                except (TypeError, ValueError):
+                    roll_result = D20.roll()
+                st.write(f"**Roll:** {roll_result['rolls']} = **{roll_result['total']}**")
+
+                # Determine success
+                success = roll_result['total'] >= judgment['difficulty_class']
+
+                if success:
+                    # Use Sonnet to narrate success
+                    narration = narrate_event(
+                        f"successfully {custom_action}",
+                        game_state["current_location"],
+                        st.empty()
+                    )
+                    st.success("✅ Success!")
+                    speak_text(narration, "action_success")
+                else:
+                    narration = narrate_event(
+                        f"failed to {custom_action}",
+                        game_state["current_location"],
+                        st.empty()
+                    )
+                    st.error("❌ Failure!")
+                    speak_text(narration, "action_failure")
+
+                log_story(f"{custom_action} - {'Success' if success else 'Failure'}")
+                mark_dirty()
+
+def render_story_log_tab():
+    """Most recent story events"""
+    st.header("📖 Story Log")
+
+    if game_state["story_log"]:
+        # One markdown element for the whole pane rather than one per entry
+        st.markdown("\n\n".join(reversed(game_state["story_log"])))
+    else:
+        st.info("Your story has just begun...")
+
+def combat_attack(char: Dict, enemy: Dict):
+    """Resolve and narrate one attack round, settling victory or defeat"""
+    result = process_combat_round(
+        "attack",
+        enemy,
+        char
+    )
+
+    # Narrate the combat
+    combat_narration = narrate_event(
+        result["description"],
+        "in combat",
+        st.empty()
+    )
+
+    speak_text(combat_narration, "combat_round")
+
+    # Update stats
+    char["hp"] = result["player_hp"]
+    enemy["hp"] = result["enemy_hp"]
+
+    # Check for victory/defeat
+    if result["enemy_hp"] <= 0:
+        st.success(f"🎉 Victory! You defeated the {enemy['name']}!")
+        if enemy.get("loot"):
+            st.write(f"**Loot:** {', '.join(enemy['loot'])}")
+            game_state["inventory"].extend(enemy["loot"])
+        game_state["current_encounter"] = None
+        log_combat(f"Defeated {enemy['name']}")
+    elif result["player_hp"] <= 0:
+        st.error("💀 You have been defeated!")
+        char["hp"] = 1
+        game_state["current_encounter"] = None
+        log_combat("Defeated in combat")
+
+def combat_defend(char: Dict, enemy: Dict):
+    """Brace against the enemy's attack, taking reduced damage"""
+    e_atk, c_def, c_hp = enemy["attack"], char["defense"], char["hp"]
+    damage = max(0, e_atk - c_def - 5)
+    char["hp"] = max(0, c_hp - damage)
+
+    st.write(f"You raise your guard! Took {damage} damage.")
+    log_combat(f"Defended - took {damage} damage")
+
+def combat_flee(char: Dict, enemy: Dict):
+    """Try to escape on a d20 roll of 10+, taking a hit on failure"""
+    flee_roll = D20.roll()
+    if flee_roll["total"] >= 10:
+        st.success("You successfully fled from combat!")
+        game_state["current_encounter"] = None
+        log_combat("Fled from combat")
+    else:
+        st.error("Failed to flee! The enemy attacks!")
+        e_atk, c_def, c_hp = enemy["attack"], char["defense"], char["hp"]
+        damage = max(0, e_atk - c_def)
+        char["hp"] = max(0, c_hp - damage)
+        log_combat(f"Failed to flee - took {damage} damage")
+
+# Combat changes the sidebar's HP and the encounter prompt, so actions rerun the whole app, not the fragment
+def do_combat_action(action: Callable[[Dict, Dict], None], char: Dict, enemy: Dict):
+    """Apply one combat action, then mark the state for autosave and rerun"""
+    action(char, enemy)
+    mark_dirty()
+    st.rerun()
+
+@st.fragment
+def render_combat_tab():
+    """Active encounter and combat actions"""
+    st.header("🗡️ Combat")
+
+    if game_state["current_encounter"]:
+        enemy = game_state["current_encounter"]
+        char = game_state["character"]
+
+        col1, col2 = st.columns(2)
+
+        with col1:
+            st.subheader(PLAYER_HEADER_TMPL.format_map(char))
+            st.progress(char['hp'] / char['max_hp'])
+            st.write(HP_LINE_TMPL.format_map(char))
+
+        with col2:
+            st.subheader(ENEMY_HEADER_TMPL.format_map(enemy))
+            st.progress(enemy['hp'] / enemy['max_hp'])
+            st.write(HP_LINE_TMPL.format_map(enemy))
+
+        st.divider()
+
+        # Combat actions
+        st.subheader("Choose your action:")
+
+        col1, col2, col3 = st.columns(3)
+
+        with col1:
+            if st.button("⚔️ Attack", key="combat_attack"):
+                with st.spinner("Processing combat..."):
+                    do_combat_action(combat_attack, char, enemy)
+
+        with col2:
+            if st.button("🛡️ Defend", key="combat_defend"):
+                with st.spinner("Defending..."):
+                    do_combat_action(combat_defend, char, enemy)
+
+        with col3:
+            if st.button("🏃 Flee", key="combat_flee"):
+                do_combat_action(combat_flee, char, enemy)
+
+        # Show combat log
+        st.divider()
+        st.subheader("Combat Log")
+        st.markdown("\n\n".join(reversed(game_state["combat_log"])))
+
+    else:
+        st.info("No active combat. Seek enemies in the Adventure tab!")
+
+    # A fragment rerun never reaches the end-of-script flush
+    flush_game_state()
+
+@st.fragment
+def render_quests_tab():
+    """Quest generation and active quests"""
+    st.header("📜 Quests")
+
+    if st.button("✨ Generate New Quest", key="quest_generate"):
+        with st.spinner("Generating quest..."):
+            context = f"Character: {game_state['character']['name']}, Location: {game_state['current_location']}"
+            quest = generate_quest(context, st.empty())
+            # The new quest is also a story log entry, so rerun the whole app; a toast survives the rerun
+            st.toast(f"New Quest: {quest['title']}")
+            st.rerun()
+
+    st.divider()
+
+    # Display active quests
+    active_quests = game_state["active_quests"]
+
+    if active_quests:
+        for quest in active_quests:
+            with st.expander(f"📌 {quest['title']}"):
+                speak_text(quest["description"], f"active_quest_{quest['title']}")
+                if st.button("Complete Quest", key=f"quest_complete_{quest['title']}"):
+                    quest["status"] = "completed"
+                    # Safe mid-iteration: st.rerun() below ends this loop
+                    active_quests.remove(quest)
+                    game_state["completed_quests"].append(quest)
+                    st.success("Quest completed!")
+                    mark_dirty()
+                    st.rerun()
+    else:
+        st.info("No active quests. Generate one to begin!")
+
+    # A fragment rerun never reaches the end-of-script flush
+    flush_game_state()
+
+
 # Main Game Area
 if not game_state["character"]:
     # Character Creation
@@ -695,21 +1560,29 @@ if not game_state["character"]:
         if st.button("⚔️ Begin Adventure", type="primary"):
             if char_name:
                 with st.spinner("Creating character and generating world..."):
-                    # Create character
-                    character = create_character(char_name, char_class)
-                    game_state["character"] = character
+                    # Character stats (Gemini) and the world intro (Sonnet) are independent,
+                    # so create the character on a worker thread while the intro streams here
+                    from google.api_core import exceptions as google_exceptions
+                    with ThreadPoolExecutor(max_workers=1) as executor:
+                        character_future = executor.submit(create_character, char_name, char_class)
+                        world_intro = generate_world_intro(st.empty())
+                        try:
+                            character = character_future.result()
+                        except (google_exceptions.GoogleAPICallError, google_exceptions.RetryError) as e:
+                            # Logged here: session state written from the worker wouldn't reach this session
+                            log_error("Gemini", e)
+                            raise
 
-                    # Generate world intro
-                    world_intro = generate_world_intro()
+                    game_state["character"] = character
                     game_state["world_context"] = world_intro
                     game_state["game_started"] = True
 
                     # Generate starting location
-                    starting_location = generate_location("village", world_intro)
+                    starting_location = generate_location("village")
                     game_state["current_location"] = starting_location["name"]
 
                     log_story(f"{char_name} the {char_class} begins their journey")
-                    save_game_state()
+                    mark_dirty()
 
                 st.success("Character created! Your adventure begins...")
                 st.rerun()
@@ -721,34 +1594,27 @@ if not game_state["character"]:
 
         save_files = get_save_files()
         if save_files:
-            for save_file in save_files:
+            for save_file, save_info in save_files.items():
                 with st.container():
-                    try:
-                        with open(save_file, "r") as f:
-                            data = json.load(f)
-                            char_data = data['character']
-
-                            col1, col2, col3 = st.columns([3, 2, 1])
-
-                            with col1:
-                                st.write(f"**{char_data['name']}**")
-                                st.caption(f"Level {char_data['level']} {char_data['class']}")
-
-                            with col2:
-                                st.write(f"HP: {char_data['hp']}/{char_data['max_hp']}")
-                                st.caption(f"Location: {data.get('current_location', 'Unknown')}")
-
-                            with col3:
-                                if st.button("Load", key=f"main_load_{save_file}", type="primary"):
-                                    if load_game_state(save_file):
-                                        st.success(f"Loaded {save_file}!")
-                                        st.rerun()
-                                    else:
-                                        st.error("Failed to load!")
-
-                            st.divider()
-                    except Exception as e:
-                        st.error(f"Error reading {save_file}: {str(e)}")
+                    col1, col2, col3 = st.columns([3, 2, 1])
+
+                    with col1:
+                        st.write(f"**{save_info['name']}**")
+                        st.caption(f"Level {save_info['level']} {save_info['class']}")
+
+                    with col2:
+                        st.write(HP_LINE_TMPL.format_map(save_info))
+                        st.caption(f"Location: {save_info['location']}")
+
+                    with col3:
+                        if st.button("Load", key=f"main_load_{save_file}", type="primary"):
+                            if load_game_state(save_file):
+                                st.success(f"Loaded {save_file}!")
+                                st.rerun()
+                            else:
+                                st.error("Failed to load!")
+
+                    st.divider()
         else:
             st.info("No saved games found. Create a new character to begin!")
 
@@ -757,251 +1623,17 @@ else:
     tab1, tab2, tab3, tab4 = st.tabs(["🎮 Adventure", "📖 Story Log", "🗡️ Combat", "📜 Quests"])
 
     with tab1:
-        st.header("Current Adventure")
-
-        # Display world context
-        if game_state["world_context"] and not game_state.get("world_shown", False):
-            st.markdown("### 🌍 Welcome to Voidwalkers")
-            speak_text(game_state["world_context"], "world_intro")
-            game_state["world_shown"] = True
-            save_game_state()
-
-        # Current location
-        if game_state["current_location"]:
-            st.subheader(f"📍 Current Location: {game_state['current_location']}")
-
-            current_loc = next((loc for loc in game_state["locations"]
-                              if loc["name"] == game_state["current_location"]), None)
-            if current_loc:
-                speak_text(current_loc["description"], f"location_{game_state['current_location']}")
-
-        st.divider()
-
-        # Actions
-        st.subheader("What do you do?")
-
-        col1, col2, col3 = st.columns(3)
-
-        with col1:
-            if st.button("🗺️ Explore Area"):
-                with st.spinner("Exploring..."):
-                    location_types = ["ruins", "forest", "cave", "shrine", "dungeon"]
-                    new_loc = generate_location(
-                        random.choice(location_types),
-                        game_state["world_context"]
-                    )
-                    st.success(f"You discovered: {new_loc['name']}")
-                    speak_text(new_loc["description"], f"new_location_{new_loc['name']}")
-
-        with col2:
-            if st.button("👥 Meet Someone"):
-                with st.spinner("Encountering..."):
-                    roles = ["merchant", "wanderer", "cultist", "guard", "mysterious figure"]
-                    npc = generate_npc(
-                        random.choice(roles),
-                        game_state["current_location"]
-                    )
-                    st.success(f"You meet: {npc['name']}")
-                    speak_text(npc["description"], f"npc_{npc['name']}")
-
-        with col3:
-            if st.button("⚔️ Seek Combat"):
-                with st.spinner("Searching for enemies..."):
-                    char_level = game_state["character"]["level"]
-                    encounter = generate_encounter("combat", char_level)
-                    game_state["current_encounter"] = encounter
-
-                    narration = narrate_event(
-                        f"encountered a {encounter['name']}",
-                        game_state["current_location"]
-                    )
-
-                    st.warning(f"⚔️ Combat Initiated!")
-                    # Combine narration and description for TTS
-                    combat_intro = f"{narration}\n\n{encounter['name']}. {encounter['description']}"
-                    speak_text(combat_intro, f"combat_encounter_{encounter['name']}")
-
-                    log_combat(f"Encountered {encounter['name']}")
-                    save_game_state()
-
-        # Custom Action
-        st.divider()
-        custom_action = st.text_input("Or describe your own action:",
-                                      placeholder="I search for hidden passages...")
-
-        if st.button("🎲 Perform Action"):
-            if custom_action:
-                with st.spinner("Processing action..."):
-                    # Use Gemini to adjudicate
-                    judgment = adjudicate_action(
-                        custom_action,
-                        game_state["character"],
-                        "medium"
-                    )
-
-                    st.write(f"**Action:** {custom_action}")
-                    st.write(f"**Required:** {judgment['required_roll']} vs DC {judgment['difficulty_class']}")
-
-                    # Roll dice
-                    roll_result = roll_dice(judgment['required_roll'])
-                    st.write(f"**Roll:** {roll_result['rolls']} = **{roll_result['total']}**")
-
-                    # Determine success
-                    success = roll_result['total'] >= judgment['difficulty_class']
-
-                    if success:
-                        # Use Sonnet to narrate success
-                        narration = narrate_event(
-                            f"successfully {custom_action}",
-                            game_state["current_location"]
-                        )
-                        st.success("✅ Success!")
-                        speak_text(narration, f"action_success_{roll_result['total']}")
-                    else:
-                        narration = narrate_event(
-                            f"failed to {custom_action}",
-                            game_state["current_location"]
-                        )
-                        st.error("❌ Failure!")
-                        speak_text(narration, f"action_failure_{roll_result['total']}")
-
-                    log_story(f"{custom_action} - {'Success' if success else 'Failure'}")
-                    save_game_state()
+        render_adventure_tab()
 
     with tab2:
-        st.header("📖 Story Log")
-
-        if game_state["story_log"]:
-            for log in reversed(game_state["story_log"][-20:]):
-                st.write(log)
-        else:
-            st.info("Your story has just begun...")
+        render_story_log_tab()
 
     with tab3:
-        st.header("🗡️ Combat")
-
-        if game_state["current_encounter"]:
-            enemy = game_state["current_encounter"]
-            char = game_state["character"]
-
-            col1, col2 = st.columns(2)
-
-            with col1:
-                st.subheader(f"👤 {char['name']}")
-                st.progress(char['hp'] / char['max_hp'])
-                st.write(f"HP: {char['hp']}/{char['max_hp']}")
-
-            with col2:
-                st.subheader(f"👹 {enemy['name']}")
-                st.progress(enemy['hp'] / enemy['max_hp'])
-                st.write(f"HP: {enemy['hp']}/{enemy['max_hp']}")
-
-            st.divider()
-
-            # Combat actions
-            st.subheader("Choose your action:")
-
-            col1, col2, col3 = st.columns(3)
-
-            with col1:
-                if st.button("⚔️ Attack"):
-                    with st.spinner("Processing combat..."):
-                        result = process_combat_round(
-                            "attack",
-                            enemy,
-                            char
-                        )
-
-                        # Narrate the combat
-                        combat_narration = narrate_event(
-                            result["description"],
-                            "in combat"
-                        )
-
-                        speak_text(combat_narration, f"combat_round_{result['player_hp']}_{result['enemy_hp']}")
-
-                        # Update stats
-                        game_state["character"]["hp"] = result["player_hp"]
-                        game_state["current_encounter"]["hp"] = result["enemy_hp"]
-
-                        # Check for victory/defeat
-                        if result["enemy_hp"] <= 0:
-                            st.success(f"🎉 Victory! You defeated the {enemy['name']}!")
-                            if enemy.get("loot"):
-                                st.write(f"**Loot:** {', '.join(enemy['loot'])}")
-                                game_state["inventory"].extend(enemy["loot"])
-                            game_state["current_encounter"] = None
-                            log_combat(f"Defeated {enemy['name']}")
-                        elif result["player_hp"] <= 0:
-                            st.error("💀 You have been defeated!")
-                            game_state["character"]["hp"] = 1
-                            game_state["current_encounter"] = None
-                            log_combat("Defeated in combat")
-
-                        save_game_state()
-                        st.rerun()
-
-            with col2:
-                if st.button("🛡️ Defend"):
-                    with st.spinner("Defending..."):
-                        damage = max(0, enemy["attack"] - char["defense"] - 5)
-                        game_state["character"]["hp"] = max(0, char["hp"] - damage)
-
-                        st.write(f"You raise your guard! Took {damage} damage.")
-                        log_combat(f"Defended - took {damage} damage")
-                        save_game_state()
-                        st.rerun()
-
-            with col3:
-                if st.button("🏃 Flee"):
-                    flee_roll = roll_dice("1d20")
-                    if flee_roll["total"] >= 10:
-                        st.success("You successfully fled from combat!")
-                        game_state["current_encounter"] = None
-                        log_combat("Fled from combat")
-                        save_game_state()
-                        st.rerun()
-                    else:
-                        st.error("Failed to flee! The enemy attacks!")
-                        damage = enemy["attack"] - char["defense"]
-                        game_state["character"]["hp"] -= damage
-                        log_combat(f"Failed to flee - took {damage} damage")
-                        save_game_state()
-                        st.rerun()
-
-            # Show combat log
-            st.divider()
-            st.subheader("Combat Log")
-            for log in reversed(game_state["combat_log"][-10:]):
-                st.write(log)
-
-        else:
-            st.info("No active combat. Seek enemies in the Adventure tab!")
+        render_combat_tab()
 
     with tab4:
-        st.header("📜 Quests")
-
-        if st.button("✨ Generate New Quest"):
-            with st.spinner("Generating quest..."):
-                context = f"Character: {game_state['character']['name']}, Location: {game_state['current_location']}"
-                quest = generate_quest(context)
-                st.success(f"New Quest: {quest['title']}")
-                speak_text(quest["description"], f"quest_{quest['title']}")
-
-        st.divider()
-
-        # Display active quests
-        active_quests = [q for q in game_state["quests"] if q.get("status") == "active"]
-
-        if active_quests:
-            for quest in active_quests:
-                with st.expander(f"📌 {quest['title']}"):
-                    speak_text(quest["description"], f"active_quest_{quest['title']}")
-                    if st.button(f"Complete Quest", key=quest["title"]):
-                        quest["status"] = "completed"
-                        st.success("Quest completed!")
-                        save_game_state()
-                        st.rerun()
-        else:
-            st.info("No active quests. Generate one to begin!")
+        render_quests_tab()
 
+# Persist whatever this run changed; handlers that st.rerun() are flushed by the run they trigger,
+# and the fragment tabs flush at the end of their own bodies
+flush_game_state()